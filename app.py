@@ -1,72 +1,155 @@
 import os
 import uuid
-import gradio as gr
+import atexit
+import asyncio
+import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
-import dotenv
-
-# your modules
-from utils.llm_manager import LLMManager
-from utils.chat_history import ChatHistory
-from utils.file_handler import FileHandler
-
-# load env and init managers
-dotenv.load_dotenv()
-llm_manager  = LLMManager()
-chat_history = ChatHistory()
-file_handler = FileHandler(config=llm_manager.config.get("file_handling", {}))
-
-# ui config
-ui = llm_manager.config.get("ui", {})
-title           = ui.get("title", "AI Chatbot")
-title_css       = ui.get("title_css", ".title-container { text-align: center; font-size: 5rem; }")
-welcome_message = ui.get("welcome_message", "Welcome to the Multi-Provider AI Chatbot!")
-chatbot_height = ui.get("chatbot_height", 600)
-bot_avatar_img = ui.get("bot_avatar_img", "None")
-human_avatar_img = ui.get("human_avatar_img", "None")
-
-# initial pick-lists
-providers       = llm_manager.get_providers()
-default_pid     = providers[0]["id"] if providers else None
-default_models  = llm_manager.get_models(default_pid) if default_pid else []
-default_mid     = default_models[0]["id"] if default_models else None
-personas        = llm_manager.get_personas()
-default_persona = personas[0]["id"] if personas else None
-
-# helper for chat-history dropdown
+
+logger = logging.getLogger(__name__)
+
+# heavy modules (gradio, yaml, provider SDKs) are imported lazily so that
+# importing this module stays cheap; managers are built on first use
+@functools.lru_cache(maxsize=1)
+def get_managers():
+    from utils.llm_manager import LLMManager
+    from utils.chat_history import ChatHistory
+    from utils.file_handler import FileHandler
+
+    llm_manager  = LLMManager()
+    chat_history = ChatHistory()
+    file_handler = FileHandler(config=llm_manager.config.get("file_handling", {}))
+    atexit.register(llm_manager.close)
+    return llm_manager, chat_history, file_handler
+
+# optional semantic response cache, stored next to the chat histories
+@functools.lru_cache(maxsize=1)
+def get_semantic_cache():
+    from utils.semantic_cache import SemanticCache
+
+    llm_manager, chat_history, _ = get_managers()
+    return SemanticCache(
+        cache_dir=os.path.join(chat_history.history_dir, "semantic_cache"),
+        config=llm_manager.config.get("semantic_cache", {})
+    )
+
+# helper for chat-history dropdown; the formatted list is cached against the
+# history directory's mtime, which changes whenever a chat file is created,
+# replaced or deleted (including by the background writer)
+_chat_options_cache: Optional[tuple] = None
+
 def list_chat_options():
-    return [
-        (f"{c['timestamp']} - {c['provider']}/{c['model']} ({c['persona']})", c["chat_id"])
-        for c in chat_history.list_chats()
-    ]
+    global _chat_options_cache
+    _, chat_history, _ = get_managers()
+    mtime = os.stat(chat_history.history_dir).st_mtime_ns
+    if _chat_options_cache is None or _chat_options_cache[0] != mtime:
+        options = [
+            (f"{c['timestamp']} - {c['provider']}/{c['model']} ({c['persona']})", c["chat_id"])
+            for c in chat_history.list_chats()
+        ]
+        _chat_options_cache = (mtime, options)
+    return _chat_options_cache[1]
+
+# chat saves are handed to a single background worker so disk I/O stays off
+# the response path; one worker keeps each chat's writes (and deletes) in order
+_save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-saver")
+atexit.register(_save_executor.shutdown, wait=True)
+
+def _save_chat(item):
+    _, chat_history, _ = get_managers()
+    try:
+        chat_history.save_chat(**item)
+    except Exception:
+        logger.exception("Error saving chat %s", item["chat_id"])
+
+def queue_chat_save(**item):
+    _save_executor.submit(_save_chat, item)
+
+# id -> display-name lookups used when saving a chat
+@functools.lru_cache(maxsize=1)
+def _name_lookups():
+    llm_manager, _, _ = get_managers()
+    provider_names = {p["id"]: p["name"] for p in llm_manager.get_providers()}
+    persona_names  = {p["id"]: p["name"] for p in llm_manager.get_personas()}
+    return provider_names, persona_names
+
+@functools.lru_cache(maxsize=32)
+def _model_names(pid):
+    llm_manager, _, _ = get_managers()
+    return {m["id"]: m["name"] for m in llm_manager.get_models(pid)}
+
+# dropdown (label, value) choices; the config is static, so build them once
+@functools.lru_cache(maxsize=1)
+def _provider_choices():
+    llm_manager, _, _ = get_managers()
+    return [(p["name"], p["id"]) for p in llm_manager.get_providers()]
+
+@functools.lru_cache(maxsize=1)
+def _persona_choices():
+    llm_manager, _, _ = get_managers()
+    return [(p["name"], p["id"]) for p in llm_manager.get_personas()]
+
+@functools.lru_cache(maxsize=None)
+def _model_choices(pid):
+    llm_manager, _, _ = get_managers()
+    return [(m["name"], m["id"]) for m in llm_manager.get_models(pid)]
 
 # load/delete chat
-def load_selected_chat(chat_id, _state):
-    data = chat_history.load_chat(chat_id) or {}
+async def load_selected_chat(chat_id, _state):
+    _, chat_history, _ = get_managers()
+    # read + parse off the event loop so other sessions are not held up
+    data = await asyncio.to_thread(chat_history.load_chat, chat_id) or {}
     msgs = data.get("messages", [])
     status = f"Loaded chat from {data.get('timestamp', 'unknown')}"
     return msgs, status, chat_id
 
 def delete_selected_chat(chat_id):
-    ok = chat_history.delete_chat(chat_id)
+    import gradio as gr
+    _, chat_history, _ = get_managers()
+    # run on the saver so a save still queued for this chat cannot recreate it
+    ok = _save_executor.submit(chat_history.delete_chat, chat_id).result()
     label = "Deleted" if ok else "Failed to delete"
     return gr.update(choices=list_chat_options(), value=None), f"{label} chat {chat_id}"
 
 # dropdown updaters
 def update_models(pid, _state):
-    models = llm_manager.get_models(pid)
-    choices = [(m["name"], m["id"]) for m in models]
+    import gradio as gr
+    choices = _model_choices(pid)
     return gr.Dropdown(choices=choices, value=(choices[0][1] if choices else None)), pid
 
 def update_model_selection(mid, _state):   return mid
 def update_persona_selection(per, _state): return per
 
+# formatted attachments block, cached per set of attached files so every
+# turn of a chat with the same uploads reuses the same string
+_FILES_BLOCK_CACHE_SIZE = 16
+_files_block_cache: Dict[tuple, str] = {}
+_files_block_lock  = threading.Lock()
+
+def _files_block(file_handler, files_state):
+    key = tuple((f.get("filepath"), f.get("size")) for f in files_state)
+    with _files_block_lock:
+        block = _files_block_cache.get(key)
+    if block is None:
+        block = file_handler.format_files_for_llm(files_state)
+        with _files_block_lock:
+            if len(_files_block_cache) >= _FILES_BLOCK_CACHE_SIZE:
+                _files_block_cache.pop(next(iter(_files_block_cache)))
+            _files_block_cache[key] = block
+    return block
+
 # file handlers
 def handle_file_upload(files, files_state):
     if not files:
         return "No files uploaded.", []
+    _, _, file_handler = get_managers()
+    # unchanged files are served from the handler's (path, mtime, size) cache
+    results = file_handler.process_files(files)
+
     infos, msgs = [], []
-    for f in files:
-        info = file_handler.process_file(f)
+    for f, info in zip(files, results):
         if info.get("error"):
             msgs.append(f"Error: {info['error']} on {info.get('filename', getattr(f, 'name', str(f)))}")
         else:
@@ -80,6 +163,8 @@ def clear_files(_):
     return "All files cleared.", []
 
 # user-bot glue
+MAX_HISTORY_MESSAGES = 50
+
 def user(msg, history):
     return "", history + [{"role": "user", "content": msg}]
 
@@ -89,38 +174,87 @@ def bot(
     files_state: List[Dict[str,Any]],
     chat_id_state: Optional[str]
 ):
-    # if there are files, stick a system message at the top
+    llm_manager, _, file_handler = get_managers()
+
+    # only the most recent messages are sent to the provider (starting on a
+    # user turn); the full history is still shown and saved
+    messages = history[-MAX_HISTORY_MESSAGES:]
+    if messages and messages[0]["role"] == "assistant":
+        messages = messages[1:]
+
+    # if there are files, stick a system message at the top of what is sent;
+    # history itself is left alone so the saved log only ever grows at the end
     if files_state:
-        file_block = file_handler.format_files_for_llm(files_state)
-        history.insert(0, {"role":"system", "content": file_block})
-
-    # ask LLM
-    resp_text, _meta = llm_manager.chat_completion(
-        provider_id=pid,
-        model_id=   mid,
-        persona_id= per,
-        messages=   history,
-        files=      files_state
-    )
-    history.append({"role":"assistant","content":resp_text})
+        file_block = _files_block(file_handler, files_state)
+        messages.insert(0, {"role":"system", "content": file_block})
 
-    # save chat
     cid = chat_id_state or str(uuid.uuid4())
-    pname = next((p["name"] for p in providers if p["id"]==pid), pid)
-    mname = next((m["name"] for m in llm_manager.get_models(pid) if m["id"]==mid), mid)
-    pername= next((p["name"] for p in personas     if p["id"]==per), per)
 
-    chat_history.save_chat(
+    # only opening prompts without attachments go through the semantic
+    # cache: later turns depend on the conversation so far
+    semantic_cache = get_semantic_cache()
+    cacheable = semantic_cache.enabled and len(history) == 1 and not files_state
+    prompt = history[-1]["content"] if history else ""
+    scope  = f"{pid}/{mid}/{per}"
+    cached = semantic_cache.lookup(prompt, scope) if cacheable else None
+
+    if cached is not None:
+        history.append({"role":"assistant","content":cached})
+    else:
+        # stream the LLM answer into a fresh assistant message
+        history.append({"role":"assistant","content":""})
+        for delta in llm_manager.chat_completion_stream(
+            provider_id=pid,
+            model_id=   mid,
+            persona_id= per,
+            messages=   messages,
+            files=      files_state
+        ):
+            history[-1]["content"] += delta
+            yield history, cid
+
+        answer = history[-1]["content"]
+        if cacheable and answer and not answer.startswith("Error"):
+            semantic_cache.store(prompt, scope, answer)
+
+    # save chat
+    provider_names, persona_names = _name_lookups()
+    pname  = provider_names.get(pid, pid)
+    mname  = _model_names(pid).get(mid, mid)
+    pername= persona_names.get(per, per)
+
+    queue_chat_save(
         chat_id=  cid,
-        messages= history,
+        messages= list(history),
         provider= pname,
         model=    mname,
         persona=  pername
     )
-    return history, cid
+    yield history, cid
 
 # build the UI
 def create_chatbot_ui():
+    import gradio as gr
+    llm_manager, _, _ = get_managers()
+
+    # ui config
+    ui = llm_manager.config.get("ui", {})
+    title           = ui.get("title", "AI Chatbot")
+    title_css       = ui.get("title_css", ".title-container { text-align: center; font-size: 5rem; }")
+    welcome_message = ui.get("welcome_message", "Welcome to the Multi-Provider AI Chatbot!")
+    chatbot_height = ui.get("chatbot_height", 600)
+    bot_avatar_img = ui.get("bot_avatar_img", "None")
+    human_avatar_img = ui.get("human_avatar_img", "None")
+    concurrency_limit = ui.get("concurrency_limit", 8)
+
+    # initial pick-lists
+    providers       = llm_manager.get_providers()
+    default_pid     = providers[0]["id"] if providers else None
+    default_models  = llm_manager.get_models(default_pid) if default_pid else []
+    default_mid     = default_models[0]["id"] if default_models else None
+    personas        = llm_manager.get_personas()
+    default_persona = personas[0]["id"] if personas else None
+
     # Build your <head> injection using your variables
     custom_head = f"""
     <title>{title}</title>
@@ -145,15 +279,15 @@ def create_chatbot_ui():
                 # pickers
                 with gr.Group():
                     provider_dropdown = gr.Dropdown(
-                        choices=[(p["name"], p["id"]) for p in providers],
+                        choices=_provider_choices(),
                         value=default_pid, label="Provider"
                     )
                     model_dropdown = gr.Dropdown(
-                        choices=[(m["name"], m["id"]) for m in default_models],
+                        choices=_model_choices(default_pid) if default_pid else [],
                         value=default_mid, label="Model"
                     )
                     persona_dropdown = gr.Dropdown(
-                        choices=[(p["name"], p["id"]) for p in personas],
+                        choices=_persona_choices(),
                         value=default_persona, label="Persona"
                     )
 
@@ -205,7 +339,7 @@ def create_chatbot_ui():
         send_btn.click(fn=user, inputs=[msg, chatbot], outputs=[msg, chatbot], queue=False)\
                 .then(fn=bot, inputs=[chatbot, provider_state, model_state, persona_state, files_state, chat_id_state],
                             outputs=[chatbot, chat_id_state])
-        wipe_btn.click(lambda: None, None, chatbot, queue=False)
+        wipe_btn.click(lambda: (None, None), None, [chatbot, chat_id_state], queue=False)
 
         # wire history buttons
         load_chat_btn.click(fn=load_selected_chat, inputs=[chat_selector, chat_id_state],
@@ -219,9 +353,14 @@ def create_chatbot_ui():
         # welcome message at the bottom
         gr.Markdown(f"### {welcome_message}")
 
+    # all per-user state lives in gr.State, so sessions can be served in
+    # parallel; LLM calls are I/O-bound and overlap well
+    demo.queue(default_concurrency_limit=concurrency_limit)
     return demo
 
 
 if __name__=="__main__":
+    import dotenv
+    dotenv.load_dotenv()
     demo = create_chatbot_ui()
     demo.launch(favicon_path='config/img/favicon.ico', pwa=True)
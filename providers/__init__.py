@@ -0,0 +1,13 @@
+import importlib
+from types import ModuleType
+from typing import Dict
+
+# Provider modules keyed by id. SDKs are imported lazily inside each module,
+# so loading them all here is cheap; a module whose own dependencies are
+# missing is left out instead of breaking the others.
+REGISTRY: Dict[str, ModuleType] = {}
+for _name in ("anthropic", "google", "ionos", "ollama", "openai"):
+    try:
+        REGISTRY[_name] = importlib.import_module(f"{__name__}.{_name}")
+    except ImportError as e:
+        print(f"Failed to load provider module {_name}: {e}")
@@ -1,38 +1,84 @@
 import os
-import requests
-import json
-from typing import List, Dict, Any, Optional, Tuple
-import anthropic
+import weakref
+import asyncio
+import functools
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from utils.file_handler import format_files_inline
 
-def chat(
-    endpoint: str,
-    model_id: str,
+@functools.lru_cache(maxsize=4)
+def _get_client(api_key: str):
+    """Return a shared Anthropic client so its HTTP connection pool is reused.
+    
+    Args:
+        api_key: Anthropic API key
+        
+    Returns:
+        anthropic.Anthropic client
+    """
+    # Imported here so the SDK is only loaded when this provider is used
+    import anthropic
+    return anthropic.Anthropic(api_key=api_key)
+
+# Async clients pool connections on the event loop that created them, so
+# they are kept per running loop (and per API key)
+_async_clients = weakref.WeakKeyDictionary()
+
+def _get_async_client(api_key: str):
+    """Return the shared async Anthropic client for the running event loop.
+    
+    Args:
+        api_key: Anthropic API key
+        
+    Returns:
+        anthropic.AsyncAnthropic client
+    """
+    import anthropic
+    clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = clients.get(api_key)
+    if client is None:
+        client = anthropic.AsyncAnthropic(api_key=api_key)
+        clients[api_key] = client
+    return client
+
+def _parse_response(response, model_id: str) -> Tuple[str, Dict[str, Any]]:
+    """Extract the text and metadata from a Messages API response.
+    
+    Args:
+        response: Anthropic Message object
+        model_id: Model identifier
+        
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    # Extract response text
+    response_text = response.content[0].text
+    
+    # Return response text and metadata
+    return response_text, {
+        "model": model_id,
+        "usage": {
+            "input_tokens": response.usage.input_tokens,
+            "output_tokens": response.usage.output_tokens,
+            "total_tokens": response.usage.input_tokens + response.usage.output_tokens
+        },
+        "finish_reason": response.stop_reason
+    }
+
+def _build_messages(
     messages: List[Dict[str, str]],
     persona_description: str,
-    model_config: Dict[str, Any],
     files: Optional[List[Dict[str, Any]]] = None
-) -> Tuple[str, Dict[str, Any]]:
-    """Generate a chat completion using Anthropic's Claude API.
+) -> List[Dict[str, str]]:
+    """Format messages, persona and attached files for the Anthropic API.
     
     Args:
-        endpoint: API endpoint (not used, Anthropic client handles this)
-        model_id: Model identifier
         messages: List of message dictionaries
         persona_description: Description of the persona
-        model_config: Model configuration
         files: Optional list of file dictionaries
         
     Returns:
-        Tuple of (response text, response metadata)
+        List of Anthropic message dictionaries
     """
-    api_key = os.environ.get("ANTHROPIC_API_KEY")
-    if not api_key:
-        return "Error: ANTHROPIC_API_KEY not found in environment variables", {}
-    
-    client = anthropic.Anthropic(api_key=api_key)
-    max_tokens = model_config.get("max_tokens", 4096)
-    
-    # Format messages for Anthropic API
     anthropic_messages = []
     
     # Add system message with persona description
@@ -42,52 +88,148 @@ def chat(
             "content": persona_description
         })
     
-    # Add file contents to the first user message if files are provided
+    # Add file contents to the first user message if files are provided;
+    # the caller's messages are left untouched
+    file_content = ""
     if files and len(messages) > 0 and messages[0]["role"] == "user":
-        file_content = ""
-        for file in files:
-            if "error" in file or "warning" in file:
-                continue
-                
-            if file.get("is_text") and file.get("content"):
-                file_content += f"\nFile: {file.get('filename')}\n"
-                file_content += f"```{file.get('extension', '').lstrip('.')}\n"
-                file_content += file.get("content", "")
-                file_content += "\n```\n\n"
-        
-        if file_content:
-            first_msg = messages[0]["content"]
-            messages[0]["content"] = first_msg + "\n\nAttached files:\n" + file_content
+        file_content = format_files_inline(files)
     
     # Convert message format to Anthropic format
-    for msg in messages:
+    for i, msg in enumerate(messages):
         role = msg["role"]
+        content = msg["content"]
+        if i == 0 and file_content:
+            content = content + "\n\nAttached files:\n" + file_content
         # Map 'assistant' to 'assistant' and everything else to 'user'
         anthropic_role = role if role == "assistant" else "user"
         anthropic_messages.append({
             "role": anthropic_role,
-            "content": msg["content"]
+            "content": content
         })
     
+    return anthropic_messages
+
+def chat(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Generate a chat completion using Anthropic's Claude API.
+    
+    Args:
+        endpoint: API endpoint (not used, Anthropic client handles this)
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
+        
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        return "Error: ANTHROPIC_API_KEY not found in environment variables", {}
+    
+    import anthropic
+    
+    client = _get_client(api_key)
+    max_tokens = model_config.get("max_tokens", 4096)
+    anthropic_messages = _build_messages(messages, persona_description, files)
+    
     try:
         response = client.messages.create(
             model=model_id,
             messages=anthropic_messages,
             max_tokens=max_tokens
         )
+        return _parse_response(response, model_id)
+    except anthropic.APIError as e:
+        return f"Error: {str(e)}", {"error": str(e)}
+
+async def chat_async(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Generate a chat completion using Anthropic's async client.
+    
+    Args:
+        endpoint: API endpoint (not used, Anthropic client handles this)
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
         
-        # Extract response text
-        response_text = response.content[0].text
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        return "Error: ANTHROPIC_API_KEY not found in environment variables", {}
+    
+    import anthropic
+    
+    client = _get_async_client(api_key)
+    max_tokens = model_config.get("max_tokens", 4096)
+    anthropic_messages = _build_messages(messages, persona_description, files)
+    
+    try:
+        response = await client.messages.create(
+            model=model_id,
+            messages=anthropic_messages,
+            max_tokens=max_tokens
+        )
+        return _parse_response(response, model_id)
+    except anthropic.APIError as e:
+        return f"Error: {str(e)}", {"error": str(e)}
+
+def chat_stream(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[str]:
+    """Stream a chat completion from Anthropic's Claude API.
+    
+    Args:
+        endpoint: API endpoint (not used, Anthropic client handles this)
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
         
-        # Return response text and metadata
-        return response_text, {
-            "model": model_id,
-            "usage": {
-                "input_tokens": response.usage.input_tokens,
-                "output_tokens": response.usage.output_tokens,
-                "total_tokens": response.usage.input_tokens + response.usage.output_tokens
-            },
-            "finish_reason": response.stop_reason
-        }
-    except requests.exceptions.RequestException as e:
-        return f"Error: {str(e)}", {"error": str(e)}
\ No newline at end of file
+    Yields:
+        Pieces of the response text
+    """
+    api_key = os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        yield "Error: ANTHROPIC_API_KEY not found in environment variables"
+        return
+    
+    import anthropic
+    
+    client = _get_client(api_key)
+    max_tokens = model_config.get("max_tokens", 4096)
+    anthropic_messages = _build_messages(messages, persona_description, files)
+    
+    try:
+        with client.messages.stream(
+            model=model_id,
+            messages=anthropic_messages,
+            max_tokens=max_tokens
+        ) as stream:
+            for text in stream.text_stream:
+                yield text
+    except anthropic.APIError as e:
+        yield f"Error: {str(e)}"
@@ -1,7 +1,75 @@
 import os
-import requests
-from typing import List, Dict, Any, Optional, Tuple
-import google.generativeai as genai
+import functools
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from utils.file_handler import format_files_inline
+
+@functools.lru_cache(maxsize=8)
+def _get_model(model_id: str, api_key: str):
+    """Return a shared GenerativeModel, configuring the SDK once per API key.
+    
+    Args:
+        model_id: Model identifier
+        api_key: Google API key
+        
+    Returns:
+        genai.GenerativeModel instance
+    """
+    # Imported here so the SDK (protobuf, grpc, ...) is only loaded when this
+    # provider is used
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name=model_id)
+
+def _start_chat(
+    model_id: str,
+    api_key: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    files: Optional[List[Dict[str, Any]]] = None
+):
+    """Create a chat session loaded with persona, files and prior messages.
+    
+    Args:
+        model_id: Model identifier
+        api_key: Google API key
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        files: Optional list of file dictionaries
+        
+    Returns:
+        Tuple of (chat session, prompt to send)
+    """
+    # Persona instructions go first: Google uses the first user message with
+    # system instructions pattern
+    history = []
+    if persona_description:
+        history.append({"role": "user", "parts": [f"System instructions: {persona_description}\n\nPlease acknowledge these instructions."]})
+        history.append({"role": "model", "parts": ["I'll follow these instructions in our conversation."]})
+    
+    # Process files if present
+    file_content = format_files_inline(files) if files else ""
+    
+    # Convert user/assistant messages, adding file content to the first one
+    for i, msg in enumerate(messages):
+        role = msg["role"]
+        if role not in ("user", "assistant"):
+            continue
+        
+        content = msg["content"]
+        if i == 0 and role == "user" and file_content:
+            content = content + "\n\nAttached files:\n" + file_content
+        history.append({"role": "user" if role == "user" else "model", "parts": [content]})
+    
+    # The last user message is sent as the prompt rather than being part of
+    # the history; if the conversation ends with the model, ask it to continue
+    if messages and messages[-1]["role"] == "user":
+        prompt = history.pop()["parts"][0]
+    else:
+        prompt = "Please continue"
+    
+    # Create the chat session with the whole history in one go
+    model = _get_model(model_id, api_key)
+    return model.start_chat(history=history), prompt
 
 def chat(
     endpoint: str,
@@ -28,61 +96,14 @@ def chat(
     if not api_key:
         return "Error: GOOGLE_API_KEY not found in environment variables", {}
     
-    genai.configure(api_key=api_key)
-    max_tokens = model_config.get("max_tokens", 8192)
-    
-    # Create a chat session
-    model = genai.GenerativeModel(model_name=model_id)
-    chat = model.start_chat(history=[])
-    
-    # Add system message with persona description
-    if persona_description:
-        # Google uses the first user message with system instructions pattern
-        system_msg = {"role": "user", "parts": [f"System instructions: {persona_description}\n\nPlease acknowledge these instructions."]}
-        assistant_ack = {"role": "model", "parts": ["I'll follow these instructions in our conversation."]}
-        chat.history.append(system_msg)
-        chat.history.append(assistant_ack)
+    from google.api_core import exceptions as google_exceptions
     
-    # Process files if present
-    file_content = ""
-    if files:
-        for file in files:
-            if "error" in file or "warning" in file:
-                continue
-                
-            if file.get("is_text") and file.get("content"):
-                file_content += f"\nFile: {file.get('filename')}\n"
-                file_content += f"```{file.get('extension', '').lstrip('.')}\n"
-                file_content += file.get("content", "")
-                file_content += "\n```\n\n"
-    
-    # Add user messages
-    for msg in messages:
-        content = msg["content"]
-        role = msg["role"]
-        
-        # Add file content to first user message
-        if role == "user" and file_content and msg == messages[0]:
-            content = content + "\n\nAttached files:\n" + file_content
-            file_content = ""  # Clear so we don't add it again
-        
-        if role == "user":
-            chat.history.append({"role": "user", "parts": [content]})
-        elif role == "assistant":
-            chat.history.append({"role": "model", "parts": [content]})
+    max_tokens = model_config.get("max_tokens", 8192)
+    chat, prompt = _start_chat(model_id, api_key, messages, persona_description, files)
     
     # Get response
     try:
-        # If the last message is from the assistant, we need to add a user message
-        last_role = messages[-1]["role"] if messages else None
-        if last_role == "assistant" or not messages:
-            response = chat.send_message("Please continue")
-        else:
-            # The last message added to the chat was from the user, so we can just get the response
-            # We need to use the last user message for generation
-            last_user_message = messages[-1]["content"]
-            response = chat.send_message(last_user_message)
-        
+        response = chat.send_message(prompt)
         response_text = response.text
         
         # Return response text and basic metadata (Google doesn't provide token counts like OpenAI)
@@ -90,5 +111,79 @@ def chat(
             "model": model_id,
             "finish_reason": "stop"  # Google doesn't provide this info directly
         }
-    except requests.exceptions.RequestException as e:
-        return f"Error: {str(e)}", {"error": str(e)}
\ No newline at end of file
+    except google_exceptions.GoogleAPIError as e:
+        return f"Error: {str(e)}", {"error": str(e)}
+
+async def chat_async(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Generate a chat completion using Google's Gemini async API.
+    
+    Args:
+        endpoint: API endpoint (not used, Google client handles this)
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
+        
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        return "Error: GOOGLE_API_KEY not found in environment variables", {}
+    
+    from google.api_core import exceptions as google_exceptions
+    
+    chat, prompt = _start_chat(model_id, api_key, messages, persona_description, files)
+    
+    try:
+        response = await chat.send_message_async(prompt)
+        return response.text, {
+            "model": model_id,
+            "finish_reason": "stop"  # Google doesn't provide this info directly
+        }
+    except google_exceptions.GoogleAPIError as e:
+        return f"Error: {str(e)}", {"error": str(e)}
+
+def chat_stream(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[str]:
+    """Stream a chat completion from Google's Gemini API.
+    
+    Args:
+        endpoint: API endpoint (not used, Google client handles this)
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
+        
+    Yields:
+        Pieces of the response text
+    """
+    api_key = os.environ.get("GOOGLE_API_KEY")
+    if not api_key:
+        yield "Error: GOOGLE_API_KEY not found in environment variables"
+        return
+    
+    from google.api_core import exceptions as google_exceptions
+    
+    chat, prompt = _start_chat(model_id, api_key, messages, persona_description, files)
+    
+    try:
+        for chunk in chat.send_message(prompt, stream=True):
+            yield chunk.text
+    except google_exceptions.GoogleAPIError as e:
+        yield f"Error: {str(e)}"
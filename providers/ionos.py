@@ -1,33 +1,99 @@
 import os
-import json
+import weakref
+import functools
+import asyncio
 import requests
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from utils.fast_json import dumps, loads
+from utils.file_handler import format_files_inline
+from utils.llm_cache import response_cache
+from utils.rate_limit import send_with_retry, send_with_retry_async
 
-def chat(
-    endpoint: str,
+# Shared session so consecutive requests reuse the same keep-alive
+# connection instead of paying a TCP+TLS handshake each time
+_session = requests.Session()
+
+# Request fields that are the same for every call
+_PAYLOAD_DEFAULTS = {"temperature": 0.7}
+
+@functools.lru_cache(maxsize=4)
+def _make_headers(api_key: str) -> Dict[str, str]:
+    """Return the (shared, read-only) request headers for an API key.
+    
+    Args:
+        api_key: API key
+        
+    Returns:
+        Headers dictionary
+    """
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json"
+    }
+
+# httpx clients are bound to the event loop that created them, so one is
+# kept per running loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def _get_async_client():
+    """Return the pooled httpx.AsyncClient for the running event loop.
+    
+    Returns:
+        httpx.AsyncClient instance
+    """
+    import httpx
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(None, connect=10.0),
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        )
+        _async_clients[loop] = client
+    return client
+
+def close():
+    """Close pooled HTTP connections.
+    
+    Each async client is closed on its own event loop: scheduled there if
+    the loop is running, run to completion if it is idle. Clients whose
+    loop is already closed (or cannot be driven from here) are left to
+    garbage collection.
+    """
+    _session.close()
+    for loop, client in list(_async_clients.items()):
+        if loop.is_closed():
+            continue
+        try:
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            else:
+                loop.run_until_complete(client.aclose())
+        except RuntimeError:
+            pass
+    _async_clients.clear()
+
+def _build_request(
+    api_key: str,
     model_id: str,
     messages: List[Dict[str, str]],
     persona_description: str,
     model_config: Dict[str, Any],
     files: Optional[List[Dict[str, Any]]] = None
-) -> Tuple[str, Dict[str, Any]]:
-    """Generate a chat completion using IONOS API.
+) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """Build the headers and payload for a chat completion request.
     
     Args:
-        endpoint: API endpoint
+        api_key: IONOS API key
         model_id: Model identifier
         messages: List of message dictionaries
         persona_description: Description of the persona
         model_config: Model configuration
         files: Optional list of file dictionaries
-        
+    
     Returns:
-        Tuple of (response text, response metadata)
+        Tuple of (headers, payload)
     """
-    api_key = os.environ.get("IONOS_API_KEY")
-    if not api_key:
-        return "Error: IONOS_API_KEY not found in environment variables", {}
-    
     max_tokens = model_config.get("max_tokens", 2048)
     
     # Format messages for IONOS API
@@ -42,20 +108,11 @@ def chat(
     
     # Add file contents to the first user message if files are provided
     if files and len(messages) > 0 and messages[0]["role"] == "user":
-        file_content = ""
-        for file in files:
-            if "error" in file or "warning" in file:
-                continue
-                
-            if file.get("is_text") and file.get("content"):
-                file_content += f"\nFile: {file.get('filename')}\n"
-                file_content += f"```{file.get('extension', '').lstrip('.')}\n"
-                file_content += file.get("content", "")
-                file_content += "\n```\n\n"
-        
+        file_content = format_files_inline(files)
         if file_content:
-            first_msg = messages[0]["content"]
-            messages[0]["content"] = first_msg + "\n\nAttached files:\n" + file_content
+            # Work on a copy so the caller's history is left untouched
+            first_msg = {**messages[0], "content": messages[0]["content"] + "\n\nAttached files:\n" + file_content}
+            messages = [first_msg, *messages[1:]]
     
     # Add user and assistant messages
     for msg in messages:
@@ -65,51 +122,220 @@ def chat(
         })
     
     # Prepare the API request
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
+    headers = _make_headers(api_key)
     payload = {
+        **_PAYLOAD_DEFAULTS,
         "model": model_id,
         "messages": formatted_messages,
-        "max_tokens": max_tokens,
-        "temperature": 0.7
+        "max_tokens": max_tokens
     }
+    return headers, payload
+
+def _parse_response(response, model_id: str) -> Tuple[str, Dict[str, Any]]:
+    """Turn a requests or httpx response into (response text, metadata).
+    
+    Args:
+        response: HTTP response object
+        model_id: Model identifier
+    
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    if response.status_code == 200:
+        response_data = loads(response.content)
+        response_text = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
+    
+        # Return response text and metadata
+        usage = response_data.get("usage", {})
+        return response_text, {
+            "model": model_id,
+            "usage": {
+                "input_tokens": usage.get("prompt_tokens", 0),
+                "output_tokens": usage.get("completion_tokens", 0),
+                "total_tokens": usage.get("total_tokens", 0)
+            },
+            "finish_reason": response_data.get("choices", [{}])[0].get("finish_reason", "stop")
+        }
+    else:
+        error_msg = f"Error: IONOS API returned status code {response.status_code}"
+        try:
+            error_data = loads(response.content)
+            if "error" in error_data:
+                error_msg += f" - {error_data['error'].get('message', '')}"
+        except:
+            pass
+    
+        return error_msg, {"error": error_msg}
+
+def chat(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Generate a chat completion using IONOS API.
+    
+    Args:
+        endpoint: API endpoint
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
+    
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    api_key = os.environ.get("IONOS_API_KEY")
+    if not api_key:
+        return "Error: IONOS_API_KEY not found in environment variables", {}
+    
+    headers, payload = _build_request(api_key, model_id, messages, persona_description, model_config, files)
+    
+    cache_key = response_cache.make_key(endpoint, payload)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
     try:
         # Make the API request
-        response = requests.post(
-            f"{endpoint}/chat/completions",
-            headers=headers,
-            json=payload
+        response = send_with_retry(
+            lambda: _session.post(
+                f"{endpoint}/chat/completions",
+                headers=headers,
+                data=dumps(payload)
+            ),
+            endpoint,
+            model_config.get("rpm", 500)
         )
-        
-        # Parse the response
+        response_text, metadata = _parse_response(response, model_id)
         if response.status_code == 200:
-            response_data = response.json()
-            response_text = response_data.get("choices", [{}])[0].get("message", {}).get("content", "")
-            
-            # Return response text and metadata
-            usage = response_data.get("usage", {})
-            return response_text, {
-                "model": model_id,
-                "usage": {
-                    "input_tokens": usage.get("prompt_tokens", 0),
-                    "output_tokens": usage.get("completion_tokens", 0),
-                    "total_tokens": usage.get("total_tokens", 0)
-                },
-                "finish_reason": response_data.get("choices", [{}])[0].get("finish_reason", "stop")
-            }
-        else:
-            error_msg = f"Error: IONOS API returned status code {response.status_code}"
-            try:
-                error_data = response.json()
-                if "error" in error_data:
-                    error_msg += f" - {error_data['error'].get('message', '')}"
-            except:
-                pass
+            response_cache.put(cache_key, response_text, metadata)
+        return response_text, metadata
+    except requests.exceptions.RequestException as e:
+        return f"Error: {str(e)}", {"error": str(e)}
+
+async def chat_async(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Generate a chat completion using IONOS API without blocking the event loop.
+    
+    Args:
+        endpoint: API endpoint
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
+    
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    api_key = os.environ.get("IONOS_API_KEY")
+    if not api_key:
+        return "Error: IONOS_API_KEY not found in environment variables", {}
+    
+    import httpx
+    
+    headers, payload = _build_request(api_key, model_id, messages, persona_description, model_config, files)
+    
+    cache_key = response_cache.make_key(endpoint, payload)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        client = _get_async_client()
+        response = await send_with_retry_async(
+            lambda: client.post(
+                f"{endpoint}/chat/completions",
+                headers=headers,
+                content=dumps(payload)
+            ),
+            endpoint,
+            model_config.get("rpm", 500)
+        )
+        response_text, metadata = _parse_response(response, model_id)
+        if response.status_code == 200:
+            response_cache.put(cache_key, response_text, metadata)
+        return response_text, metadata
+    except httpx.HTTPError as e:
+        return f"Error: {str(e)}", {"error": str(e)}
+
+def chat_stream(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[str]:
+    """Stream a chat completion from IONOS API.
+    
+    Args:
+        endpoint: API endpoint
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
+        
+    Yields:
+        Pieces of the response text as they arrive
+    """
+    api_key = os.environ.get("IONOS_API_KEY")
+    if not api_key:
+        yield "Error: IONOS_API_KEY not found in environment variables"
+        return
+    
+    headers, payload = _build_request(api_key, model_id, messages, persona_description, model_config, files)
+    
+    cache_key = response_cache.make_key(endpoint, payload)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield cached[0]
+        return
+    
+    try:
+        response = send_with_retry(
+            lambda: _session.post(
+                f"{endpoint}/chat/completions",
+                headers=headers,
+                data=dumps({**payload, "stream": True}),
+                stream=True
+            ),
+            endpoint,
+            model_config.get("rpm", 500)
+        )
+        with response:
+            if response.status_code != 200:
+                yield _parse_response(response, model_id)[0]
+                return
             
-            return error_msg, {"error": error_msg}
+            parts = []
+            completed = False
+            for line in response.iter_lines():
+                # Server-sent events: "data: {json}" frames, ending with "data: [DONE]"
+                if not line.startswith(b"data: "):
+                    continue
+                data = line[6:]
+                if data == b"[DONE]":
+                    completed = True
+                    break
+                choices = loads(data).get("choices") or [{}]
+                delta = choices[0].get("delta", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        # Only cache replies that arrived in full
+        if completed and parts:
+            response_cache.put(cache_key, "".join(parts), {"model": model_id, "finish_reason": "stop"})
     except requests.exceptions.RequestException as e:
-        return f"Error: {str(e)}", {"error": str(e)}
\ No newline at end of file
+        yield f"Error: {str(e)}"
@@ -1,31 +1,87 @@
 import os
+import weakref
+import asyncio
 import requests
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from utils.fast_json import dumps, loads
+from utils.file_handler import format_files_inline
+from utils.llm_cache import response_cache
+from utils.rate_limit import send_with_retry, send_with_retry_async
 
-def chat(
-    endpoint: str,
+# Shared session so consecutive requests reuse the same keep-alive
+# connection instead of opening a new one each time
+_session = requests.Session()
+
+# Request bodies are serialized up front with fast_json
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Request fields that are the same for every call
+_PAYLOAD_DEFAULTS = {
+    "stream": False,
+    "options": {
+        "temperature": 0.7
+    }
+}
+
+# httpx clients are bound to the event loop that created them, so one is
+# kept per running loop
+_async_clients = weakref.WeakKeyDictionary()
+
+def _get_async_client():
+    """Return the pooled httpx.AsyncClient for the running event loop.
+    
+    Returns:
+        httpx.AsyncClient instance
+    """
+    import httpx
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(None, connect=10.0),
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32)
+        )
+        _async_clients[loop] = client
+    return client
+
+def close():
+    """Close pooled HTTP connections.
+    
+    Each async client is closed on its own event loop: scheduled there if
+    the loop is running, run to completion if it is idle. Clients whose
+    loop is already closed (or cannot be driven from here) are left to
+    garbage collection.
+    """
+    _session.close()
+    for loop, client in list(_async_clients.items()):
+        if loop.is_closed():
+            continue
+        try:
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+            else:
+                loop.run_until_complete(client.aclose())
+        except RuntimeError:
+            pass
+    _async_clients.clear()
+
+def _build_payload(
     model_id: str,
     messages: List[Dict[str, str]],
     persona_description: str,
-    model_config: Dict[str, Any],
     files: Optional[List[Dict[str, Any]]] = None
-) -> Tuple[str, Dict[str, Any]]:
-    """Generate a chat completion using Ollama API.
+) -> Dict[str, Any]:
+    """Build the payload for a chat request.
     
     Args:
-        endpoint: API endpoint
         model_id: Model identifier
         messages: List of message dictionaries
         persona_description: Description of the persona
-        model_config: Model configuration
         files: Optional list of file dictionaries
-        
+    
     Returns:
-        Tuple of (response text, response metadata)
+        Request payload dictionary
     """
-    if not endpoint:
-        endpoint = "http://localhost:11434"
-    
     # Format messages for Ollama API
     formatted_messages = []
     
@@ -38,20 +94,11 @@ def chat(
     
     # Add file contents to the first user message if files are provided
     if files and len(messages) > 0 and messages[0]["role"] == "user":
-        file_content = ""
-        for file in files:
-            if "error" in file or "warning" in file:
-                continue
-                
-            if file.get("is_text") and file.get("content"):
-                file_content += f"\nFile: {file.get('filename')}\n"
-                file_content += f"```{file.get('extension', '').lstrip('.')}\n"
-                file_content += file.get("content", "")
-                file_content += "\n```\n\n"
-        
+        file_content = format_files_inline(files)
         if file_content:
-            first_msg = messages[0]["content"]
-            messages[0]["content"] = first_msg + "\n\nAttached files:\n" + file_content
+            # Work on a copy so the caller's history is left untouched
+            first_msg = {**messages[0], "content": messages[0]["content"] + "\n\nAttached files:\n" + file_content}
+            messages = [first_msg, *messages[1:]]
     
     # Add user and assistant messages
     for msg in messages:
@@ -63,48 +110,209 @@ def chat(
             ollama_role = "system"
         else:
             ollama_role = "user"
-            
+    
         formatted_messages.append({
             "role": ollama_role,
             "content": msg["content"]
         })
     
     # Prepare the API request
-    payload = {
-        "model": model_id,
-        "messages": formatted_messages,
-        "stream": False,
-        "options": {
-            "temperature": 0.7
+    return {**_PAYLOAD_DEFAULTS, "model": model_id, "messages": formatted_messages}
+
+def _parse_response(response, model_id: str) -> Tuple[str, Dict[str, Any]]:
+    """Turn a requests or httpx response into (response text, metadata).
+    
+    Args:
+        response: HTTP response object
+        model_id: Model identifier
+    
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    if response.status_code == 200:
+        response_data = loads(response.content)
+        response_text = response_data.get("message", {}).get("content", "")
+    
+        # Return response text and metadata
+        return response_text, {
+            "model": model_id,
+            "total_tokens": response_data.get("total_tokens", 0)
         }
-    }
+    else:
+        error_msg = f"Error: Ollama API returned status code {response.status_code}"
+        try:
+            error_data = loads(response.content)
+            if "error" in error_data:
+                error_msg += f" - {error_data['error']}"
+        except:
+            pass
+    
+        return error_msg, {"error": error_msg}
+
+def chat(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Generate a chat completion using Ollama API.
+    
+    Args:
+        endpoint: API endpoint
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
+    
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    if not endpoint:
+        endpoint = "http://localhost:11434"
+    
+    payload = _build_payload(model_id, messages, persona_description, files)
+    
+    cache_key = response_cache.make_key(endpoint, payload)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
     try:
         # Make the API request
-        response = requests.post(
-            f"{endpoint}/api/chat",
-            json=payload
+        response = send_with_retry(
+            lambda: _session.post(
+                f"{endpoint}/api/chat",
+                headers=_JSON_HEADERS,
+                data=dumps(payload)
+            ),
+            endpoint,
+            model_config.get("rpm")
         )
-        
-        # Parse the response
+        response_text, metadata = _parse_response(response, model_id)
         if response.status_code == 200:
-            response_data = response.json()
-            response_text = response_data.get("message", {}).get("content", "")
-            
-            # Return response text and metadata
-            return response_text, {
-                "model": model_id,
-                "total_tokens": response_data.get("total_tokens", 0)
-            }
-        else:
-            error_msg = f"Error: Ollama API returned status code {response.status_code}"
-            try:
-                error_data = response.json()
-                if "error" in error_data:
-                    error_msg += f" - {error_data['error']}"
-            except:
-                pass
+            response_cache.put(cache_key, response_text, metadata)
+        return response_text, metadata
+    except requests.exceptions.RequestException as e:
+        return f"Error: {str(e)}", {"error": str(e)}
+
+async def chat_async(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Tuple[str, Dict[str, Any]]:
+    """Generate a chat completion using Ollama API without blocking the event loop.
+    
+    Args:
+        endpoint: API endpoint
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
+    
+    Returns:
+        Tuple of (response text, response metadata)
+    """
+    if not endpoint:
+        endpoint = "http://localhost:11434"
+    
+    import httpx
+    
+    payload = _build_payload(model_id, messages, persona_description, files)
+    
+    cache_key = response_cache.make_key(endpoint, payload)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        client = _get_async_client()
+        response = await send_with_retry_async(
+            lambda: client.post(
+                f"{endpoint}/api/chat",
+                headers=_JSON_HEADERS,
+                content=dumps(payload)
+            ),
+            endpoint,
+            model_config.get("rpm")
+        )
+        response_text, metadata = _parse_response(response, model_id)
+        if response.status_code == 200:
+            response_cache.put(cache_key, response_text, metadata)
+        return response_text, metadata
+    except httpx.HTTPError as e:
+        return f"Error: {str(e)}", {"error": str(e)}
+
+def chat_stream(
+    endpoint: str,
+    model_id: str,
+    messages: List[Dict[str, str]],
+    persona_description: str,
+    model_config: Dict[str, Any],
+    files: Optional[List[Dict[str, Any]]] = None
+) -> Iterator[str]:
+    """Stream a chat completion from Ollama API.
+    
+    Args:
+        endpoint: API endpoint
+        model_id: Model identifier
+        messages: List of message dictionaries
+        persona_description: Description of the persona
+        model_config: Model configuration
+        files: Optional list of file dictionaries
+        
+    Yields:
+        Pieces of the response text as they arrive
+    """
+    if not endpoint:
+        endpoint = "http://localhost:11434"
+    
+    payload = _build_payload(model_id, messages, persona_description, files)
+    
+    cache_key = response_cache.make_key(endpoint, payload)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        yield cached[0]
+        return
+    
+    try:
+        response = send_with_retry(
+            lambda: _session.post(
+                f"{endpoint}/api/chat",
+                headers=_JSON_HEADERS,
+                data=dumps({**payload, "stream": True}),
+                stream=True
+            ),
+            endpoint,
+            model_config.get("rpm")
+        )
+        with response:
+            if response.status_code != 200:
+                yield _parse_response(response, model_id)[0]
+                return
             
-            return error_msg, {"error": error_msg}
+            parts = []
+            completed = False
+            for line in response.iter_lines():
+                # Newline-delimited JSON, one object per chunk
+                if not line:
+                    continue
+                chunk = loads(line)
+                delta = chunk.get("message", {}).get("content")
+                if delta:
+                    parts.append(delta)
+                    yield delta
+                if chunk.get("done"):
+                    completed = True
+                    break
+        # Only cache replies that arrived in full
+        if completed and parts:
+            response_cache.put(cache_key, "".join(parts), {"model": model_id})
     except requests.exceptions.RequestException as e:
-        return f"Error: {str(e)}", {"error": str(e)}
\ No newline at end of file
+        yield f"Error: {str(e)}"
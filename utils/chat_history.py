@@ -1,7 +1,18 @@
-import json
 import os
+import hashlib
+import logging
+import tempfile
+import threading
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from utils.fast_json import dumps as _dumps, loads as _loads
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Serializes writes to chat files: saves run on the background saver while
+# listing (which migrates legacy chats) and deletes run on request threads
+_write_lock = threading.Lock()
 
 class ChatHistory:
     def __init__(self, history_dir: str = "chat_histories"):
@@ -12,6 +23,110 @@ class ChatHistory:
         """
         self.history_dir = history_dir
         os.makedirs(self.history_dir, exist_ok=True)
+        
+        # (message count, fingerprint of the last message) already written to
+        # each chat's log, so that save_chat only has to append what is new
+        self._saved_logs: Dict[str, Tuple[int, Optional[str]]] = {}
+        
+        # Listing entries per metadata file, keyed by (mtime_ns, size) so
+        # list_chats only re-parses files that changed since the last call
+        self._meta_cache: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+    
+    def _meta_path(self, chat_id: str) -> str:
+        return os.path.join(self.history_dir, f"{chat_id}.json")
+    
+    def _log_path(self, chat_id: str) -> str:
+        return os.path.join(self.history_dir, f"{chat_id}.jsonl")
+    
+    def _write_atomic(self, filepath: str, data: bytes):
+        """Replace a file's contents so readers never see a partial write.
+        
+        Args:
+            filepath: Path of the file to write
+            data: New file contents
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    
+    @staticmethod
+    def _fingerprint(messages: List[Dict[str, Any]]) -> Optional[str]:
+        """Fingerprint the last message of a history.
+        
+        Only role and content are hashed: Gradio hands messages back with
+        extra keys (metadata, options) that were not there when saved.
+        
+        Args:
+            messages: List of message dictionaries
+            
+        Returns:
+            Hex digest of the last message, or None for an empty history
+        """
+        if not messages:
+            return None
+        last = messages[-1]
+        data = _dumps([last.get("role"), last.get("content")])
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+    
+    def _stored_log_state(self, chat_id: str) -> Optional[Tuple[int, Optional[str]]]:
+        """Read what an existing chat log holds on disk.
+        
+        Args:
+            chat_id: Unique identifier for the chat
+            
+        Returns:
+            Tuple of (message count, last message fingerprint) from the chat's
+            metadata, or None if unknown
+        """
+        filepath = self._meta_path(chat_id)
+        if not os.path.exists(filepath) or not os.path.exists(self._log_path(chat_id)):
+            return None
+        
+        try:
+            with open(filepath, "rb") as f:
+                chat_data = _loads(f.read())
+        except Exception:
+            logger.exception("Error reading chat metadata %s", chat_id)
+            return None
+        
+        count = chat_data.get("message_count")
+        if count is None or (count and "last_message_hash" not in chat_data):
+            return None
+        return count, chat_data.get("last_message_hash")
+    
+    def _migrate_legacy_chat(self, filepath: str) -> Dict[str, Any]:
+        """Split an older chat file with inline messages into metadata + log.
+        
+        The file is read again here, so a chat saved since the caller read
+        it is not overwritten. Call with _write_lock held.
+        
+        Args:
+            filepath: Path of the chat's metadata file
+            
+        Returns:
+            The chat's metadata after migration
+        """
+        with open(filepath, "rb") as f:
+            chat_data = _loads(f.read())
+        if "messages" not in chat_data:
+            return chat_data
+        
+        messages = chat_data.pop("messages")
+        chat_data["message_count"] = len(messages)
+        chat_data["last_message_hash"] = self._fingerprint(messages)
+        chat_id = chat_data.get("chat_id") or os.path.basename(filepath)[:-len(".json")]
+        
+        # Log first: if interrupted, the inline copy is still intact
+        self._write_atomic(self._log_path(chat_id),
+                           b"".join(_dumps(message) + b"\n" for message in messages))
+        self._write_atomic(filepath, _dumps(chat_data, indent=True))
+        self._saved_logs[chat_id] = (len(messages), chat_data["last_message_hash"])
+        return chat_data
     
     def save_chat(self, chat_id: str, messages: List[Dict[str, Any]], 
                   provider: str, model: str, persona: str) -> str:
@@ -36,14 +151,35 @@ class ChatHistory:
             "provider": provider,
             "model": model,
             "persona": persona,
-            "messages": messages
+            "message_count": len(messages),
+            "last_message_hash": self._fingerprint(messages)
         }
         
-        filename = f"{chat_id}.json"
-        filepath = os.path.join(self.history_dir, filename)
-        
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(chat_data, f, indent=2, ensure_ascii=False)
+        # Messages go to an append-only JSON-lines log; only messages added
+        # since the last save are written. The full log is rewritten when
+        # nothing is known about the chat, or when the saved messages are not
+        # a prefix of the new history (it got shorter, or a different
+        # conversation is being saved under the same id).
+        with _write_lock:
+            saved = self._saved_logs.get(chat_id)
+            if saved is None:
+                saved = self._stored_log_state(chat_id)
+            if (saved is None or saved[0] > len(messages)
+                    or self._fingerprint(messages[:saved[0]]) != saved[1]):
+                mode, new_messages = "w", messages
+            else:
+                mode, new_messages = "a", messages[saved[0]:]
+            
+            log_data = b"".join(_dumps(message) + b"\n" for message in new_messages)
+            if mode == "a":
+                with open(self._log_path(chat_id), "ab") as f:
+                    f.write(log_data)
+            else:
+                self._write_atomic(self._log_path(chat_id), log_data)
+            self._saved_logs[chat_id] = (len(messages), chat_data["last_message_hash"])
+            
+            filepath = self._meta_path(chat_id)
+            self._write_atomic(filepath, _dumps(chat_data, indent=True))
         
         return filepath
     
@@ -56,16 +192,26 @@ class ChatHistory:
         Returns:
             Dictionary with chat data or None if not found
         """
-        filepath = os.path.join(self.history_dir, f"{chat_id}.json")
+        filepath = self._meta_path(chat_id)
         
         if not os.path.exists(filepath):
             return None
         
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading chat history: {e}")
+            with open(filepath, "rb") as f:
+                chat_data = _loads(f.read())
+            
+            # Older chats keep their messages inline in the metadata file
+            if "messages" not in chat_data:
+                messages = []
+                log_path = self._log_path(chat_id)
+                if os.path.exists(log_path):
+                    with open(log_path, "rb") as f:
+                        messages = [_loads(line) for line in f if line.strip()]
+                chat_data["messages"] = messages
+            return chat_data
+        except Exception:
+            logger.exception("Error loading chat history %s", chat_id)
             return None
     
     def list_chats(self) -> List[Dict[str, Any]]:
@@ -75,22 +221,40 @@ class ChatHistory:
             List of chat metadata dictionaries
         """
         chats = []
+        meta_cache = {}
         
-        for filename in os.listdir(self.history_dir):
-            if filename.endswith(".json"):
-                try:
-                    filepath = os.path.join(self.history_dir, filename)
-                    with open(filepath, "r", encoding="utf-8") as f:
-                        data = json.load(f)
-                        chats.append({
-                            "chat_id": data.get("chat_id"),
-                            "timestamp": data.get("timestamp"),
-                            "provider": data.get("provider"),
-                            "model": data.get("model"),
-                            "persona": data.get("persona")
-                        })
-                except Exception as e:
-                    print(f"Error reading chat file {filename}: {e}")
+        with os.scandir(self.history_dir) as it:
+            entries = [entry for entry in it if entry.name.endswith(".json") and entry.is_file()]
+        
+        for entry in entries:
+            filename = entry.name
+            try:
+                st = entry.stat()
+                cached = self._meta_cache.get(filename)
+                if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+                    chat = cached[2]
+                else:
+                    with open(entry.path, "rb") as f:
+                        data = _loads(f.read())
+                    if "messages" in data:
+                        # One-off migration so later listings only read metadata
+                        with _write_lock:
+                            data = self._migrate_legacy_chat(entry.path)
+                        st = os.stat(entry.path)
+                    chat = {
+                        "chat_id": data.get("chat_id"),
+                        "timestamp": data.get("timestamp"),
+                        "provider": data.get("provider"),
+                        "model": data.get("model"),
+                        "persona": data.get("persona")
+                    }
+                meta_cache[filename] = (st.st_mtime_ns, st.st_size, chat)
+                chats.append(dict(chat))
+            except Exception:
+                logger.exception("Error reading chat file %s", filename)
+        
+        # Replaced wholesale so entries for deleted chats are dropped
+        self._meta_cache = meta_cache
         
         # Sort by timestamp (newest first)
         chats.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
@@ -105,13 +269,18 @@ class ChatHistory:
         Returns:
             True if deleted successfully, False otherwise
         """
-        filepath = os.path.join(self.history_dir, f"{chat_id}.json")
+        filepath = self._meta_path(chat_id)
         
-        if os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-                return True
-            except Exception as e:
-                print(f"Error deleting chat history: {e}")
-                return False
+        with _write_lock:
+            if os.path.exists(filepath):
+                try:
+                    os.remove(filepath)
+                    log_path = self._log_path(chat_id)
+                    if os.path.exists(log_path):
+                        os.remove(log_path)
+                    self._saved_logs.pop(chat_id, None)
+                    return True
+                except Exception:
+                    logger.exception("Error deleting chat history %s", chat_id)
+                    return False
         return False
\ No newline at end of file
@@ -0,0 +1,24 @@
+from typing import Any
+
+# orjson is several times faster than the stdlib json module; fall back to
+# json when it is not installed. Both variants work on UTF-8 bytes.
+try:
+    import orjson
+
+    def dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+        option = 0
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, option=option)
+
+    loads = orjson.loads
+except ImportError:
+    import json
+
+    def dumps(obj: Any, indent: bool = False, sort_keys: bool = False) -> bytes:
+        return json.dumps(obj, indent=2 if indent else None, sort_keys=sort_keys,
+                          ensure_ascii=False).encode("utf-8")
+
+    loads = json.loads
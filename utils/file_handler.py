@@ -1,7 +1,12 @@
 import os
-import mimetypes
+import mmap
+import hashlib
+import functools
+import threading
 import tempfile
 import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Union, Optional
 import base64
 from pathlib import Path
@@ -10,7 +15,98 @@ from pathlib import Path
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# MIME types of the default allowed extensions (and a few other common
+# ones), so mimetypes (which reads the system MIME databases on first use)
+# is only imported for anything else. Where mimetypes' answer depends on
+# the system databases, the values here are fixed choices
+_EXT_TO_MIME = {
+    ".txt": "text/plain",
+    ".py": "text/x-python",
+    ".js": "text/javascript",
+    ".html": "text/html",
+    ".css": "text/css",
+    ".json": "application/json",
+    ".md": "text/markdown",
+    ".csv": "text/csv",
+    ".xml": "text/xml",
+    ".yml": "application/yaml",
+    ".yaml": "application/yaml",
+    ".ini": "text/plain",
+    ".cfg": "text/plain",
+    ".conf": "text/plain",
+    ".sh": "text/x-sh",
+    ".pdf": "application/pdf"
+}
+
+@functools.lru_cache(maxsize=256)
+def _guess_mime_type(extension: str) -> Optional[str]:
+    """Guess a MIME type from a file extension, cached per extension.
+    
+    Args:
+        extension: File extension including the dot, e.g. ".py"
+        
+    Returns:
+        MIME type, or None if unknown
+    """
+    mime_type = _EXT_TO_MIME.get(extension.lower())
+    if mime_type is None:
+        import mimetypes
+        mime_type = mimetypes.guess_type(f"file{extension}")[0]
+    return mime_type
+
+def _file_extension(name: str) -> str:
+    """Return the lowercased extension of a file name, including the dot.
+    
+    Equivalent to os.path.splitext(name)[1].lower() for bare file names
+    (leading dots do not start an extension), using a single rpartition.
+    Callers holding a path pass its basename.
+    
+    Args:
+        name: File name without directory
+        
+    Returns:
+        Extension such as ".py", or "" if there is none
+    """
+    head, sep, ext = name.rpartition('.')
+    return '.' + ext.lower() if sep and head.strip('.') else ''
+
+def format_files_inline(files: List[Dict[str, Any]]) -> str:
+    """Render text file contents as fenced blocks to inline into a message.
+    
+    Used by the providers to append attached files to the first user message.
+    
+    Args:
+        files: List of file dictionaries from process_file/process_folder
+        
+    Returns:
+        Formatted file contents, empty if no text files are attached
+    """
+    return "".join(
+        f"\nFile: {file.get('filename')}\n```{file.get('extension', '').lstrip('.')}\n{file['content']}\n```\n\n"
+        for file in files
+        if "error" not in file and "warning" not in file and file.get("is_text") and file.get("content")
+    )
+
 class FileHandler:
+    # Tried in order when decoding text files; latin-1 accepts any byte
+    # sequence, so it has to come last
+    TEXT_ENCODINGS = ('utf-8', 'cp1252', 'latin-1')
+    
+    # Files larger than this are memory-mapped and decoded straight from the
+    # page cache instead of being copied into a bytes object first
+    MMAP_THRESHOLD = 512 * 1024
+    
+    # Number of decoded texts kept, keyed by a digest of the raw bytes, and
+    # their total length (characters)
+    TEXT_CACHE_SIZE = 128
+    TEXT_CACHE_MAX_CHARS = 32 * 1024 * 1024
+    
+    # Number of processed files kept, keyed by (path, mtime, size), and the
+    # total length of their contents (characters), so the cache cannot pin
+    # an unbounded amount of old uploads
+    FILE_CACHE_SIZE = 256
+    FILE_CACHE_MAX_CHARS = 32 * 1024 * 1024
+    
     def __init__(self, temp_dir: Optional[str] = None, config=None):
         """Initialize the file handler.
         
@@ -30,22 +126,98 @@ class FileHandler:
             '.xml', '.yml', '.yaml', '.ini', '.cfg', '.conf'
         ]
         self.allowed_extensions = self.config.get("allowed_extensions", default_extensions)
+        # Hashed copy for membership tests; the list keeps the configured
+        # order for messages
+        self._allowed_ext_set = frozenset(ext.lower() for ext in self.allowed_extensions or ())
+        self._allowed_ext_text = ', '.join(self.allowed_extensions or ())
         
         # Get other configuration parameters with defaults
         self.max_file_size_mb = self.config.get("max_file_size_mb", 10)
         self.max_files = self.config.get("max_files_per_upload", 100)
         self.max_text_size_mb = self.config.get("max_text_size_mb", 5.0)
+        self.io_workers = self.config.get("io_workers", 8)
         
         # Calculate derived values
         self.max_file_size_bytes = int(self.max_file_size_mb * 1024 * 1024)
         self.max_text_size_bytes = int(self.max_text_size_mb * 1024 * 1024)
         
+        # Same bytes uploaded again (under any name or path) reuse the decoded text
+        self._text_cache: "OrderedDict[bytes, str]" = OrderedDict()
+        self._text_cache_chars = 0
+        self._text_cache_lock = threading.Lock()
+        
+        # Unchanged files (same path, mtime and size) are not read again
+        self._file_cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._file_cache_chars = 0
+        self._file_cache_lock = threading.Lock()
+        
         logger.info(f"FileHandler initialized with temp directory: {self.temp_dir}")
         logger.info(f"Allowed extensions: {self.allowed_extensions}")
         logger.info(f"Max file size: {self.max_file_size_mb} MB")
         logger.info(f"Max text size for reading: {self.max_text_size_mb} MB")
         logger.info(f"Max files per upload: {self.max_files}")
     
+    def _decode_text_cached(self, data) -> Optional[str]:
+        """Decode file contents, reusing the result for identical bytes.
+        
+        Args:
+            data: bytes or any buffer (e.g. an mmap) holding the file contents
+            
+        Returns:
+            Decoded text, or None if no encoding fits
+        """
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        with self._text_cache_lock:
+            content = self._text_cache.get(digest)
+            if content is not None:
+                self._text_cache.move_to_end(digest)
+                logger.debug("Reusing decoded text for identical file contents")
+                return content
+        
+        content = self._decode_text(data)
+        if content is not None and len(content) <= self.TEXT_CACHE_MAX_CHARS:
+            with self._text_cache_lock:
+                previous = self._text_cache.pop(digest, None)
+                if previous is not None:
+                    self._text_cache_chars -= len(previous)
+                self._text_cache[digest] = content
+                self._text_cache_chars += len(content)
+                while (len(self._text_cache) > self.TEXT_CACHE_SIZE
+                       or self._text_cache_chars > self.TEXT_CACHE_MAX_CHARS):
+                    _, evicted = self._text_cache.popitem(last=False)
+                    self._text_cache_chars -= len(evicted)
+        return content
+    
+    def _decode_text(self, data) -> Optional[str]:
+        """Decode file contents, trying each of TEXT_ENCODINGS in turn.
+        
+        Args:
+            data: bytes or any buffer (e.g. an mmap) holding the file contents
+            
+        Returns:
+            Decoded text with newlines normalized, or None if no encoding fits
+        """
+        encodings = self.TEXT_ENCODINGS
+        if data[:3] == b'\xef\xbb\xbf':
+            # UTF-8 byte order mark: decode as UTF-8 and drop the mark
+            encodings = ('utf-8-sig',) + self.TEXT_ENCODINGS[1:]
+        elif isinstance(data, bytes) and data.isascii():
+            # Plain ASCII (checked in C) decodes the same under every candidate
+            encodings = ('ascii',)
+        
+        for encoding in encodings:
+            try:
+                content = str(data, encoding)
+            except UnicodeDecodeError:
+                continue
+            logger.debug(f"Successfully read file with encoding: {encoding}")
+            
+            # Match text-mode reads, which translate \r\n and \r to \n
+            if '\r' in content:
+                content = content.replace('\r\n', '\n').replace('\r', '\n')
+            return content
+        return None
+    
     def process_file(self, file) -> Dict[str, Any]:
         """Process a file uploaded through Gradio.
         
@@ -56,6 +228,10 @@ class FileHandler:
             Dictionary with file metadata and content
         """
         try:
+            # Stat results already known to the caller (e.g. from a directory scan)
+            known_size = None
+            known_mtime = None
+            
             # Handle different types of file objects that Gradio might provide
             if hasattr(file, "path"):
                 filepath = file.path
@@ -68,28 +244,46 @@ class FileHandler:
             elif isinstance(file, dict):
                 filepath = file.get("path", "")
                 filename = file.get("name", os.path.basename(filepath))
+                known_size = file.get("size")
+                known_mtime = file.get("mtime_ns")
                 logger.debug(f"Processing file as dictionary: {filepath}")
             else:
                 filepath = str(file)
                 filename = os.path.basename(filepath)
                 logger.debug(f"Processing file as string: {filepath}")
             
-            if not filepath or not os.path.exists(filepath):
+            if filepath and (known_size is None or known_mtime is None):
+                try:
+                    st = os.stat(filepath)
+                    known_size, known_mtime = st.st_size, st.st_mtime_ns
+                except OSError:
+                    known_size = None
+            
+            if not filepath or known_size is None:
                 logger.warning(f"File not found: {filepath}")
                 return {"error": f"File not found: {filepath}"}
             
             # Check file extension
-            file_extension = os.path.splitext(filename)[1].lower()
+            file_extension = _file_extension(os.path.basename(filename))
             
-            if self.allowed_extensions and file_extension not in self.allowed_extensions:
+            if self._allowed_ext_set and file_extension not in self._allowed_ext_set:
                 logger.warning(f"Unsupported file type: {file_extension}")
                 return {
-                    "error": f"Unsupported file type: {file_extension}. Allowed extensions: {', '.join(self.allowed_extensions)}",
+                    "error": f"Unsupported file type: {file_extension}. Allowed extensions: {self._allowed_ext_text}",
                     "filename": filename
                 }
             
-            mime_type, _ = mimetypes.guess_type(filepath)
-            file_size = os.path.getsize(filepath)
+            cache_key = (os.path.abspath(filepath), known_mtime, known_size)
+            with self._file_cache_lock:
+                cached = self._file_cache.get(cache_key)
+                if cached is not None:
+                    self._file_cache.move_to_end(cache_key)
+            if cached is not None:
+                logger.debug(f"Reusing processed file: {filename}")
+                return {**cached, "filename": filename}
+            
+            mime_type = _guess_mime_type(_file_extension(os.path.basename(filepath)))
+            file_size = known_size
             
             if file_size > self.max_file_size_bytes:
                 logger.warning(f"File too large: {file_size/1024/1024:.1f} MB (max: {self.max_file_size_mb} MB)")
@@ -100,12 +294,8 @@ class FileHandler:
             
             logger.info(f"Processing file: {filename} ({file_size/1024:.1f} KB, {mime_type})")
             
-            # Check if it's a text file
-            is_text = False
-            if mime_type and mime_type.startswith('text/'):
-                is_text = True
-            elif file_extension in self.allowed_extensions:
-                is_text = True
+            # Check if it's a text file (allowed extensions are text formats)
+            is_text = file_extension in self._allowed_ext_set or bool(mime_type and mime_type.startswith('text/'))
             
             content = None
             if is_text:
@@ -123,19 +313,20 @@ class FileHandler:
                         "warning": "File too large to read fully"
                     }
                 
-                # Try multiple encodings
-                encodings = ['utf-8', 'latin-1', 'cp1252']
-                for encoding in encodings:
-                    try:
-                        with open(filepath, 'r', encoding=encoding) as f:
-                            content = f.read()
-                        logger.debug(f"Successfully read file with encoding: {encoding}")
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                    except Exception as e:
-                        logger.error(f"Error reading file: {str(e)}")
-                        return {"error": f"Error reading file: {str(e)}", "filename": filename}
+                # Read the file once and try multiple encodings in memory
+                try:
+                    with open(filepath, 'rb') as f:
+                        if file_size > self.MMAP_THRESHOLD:
+                            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                                # Hint sequential access so the kernel reads ahead
+                                if hasattr(mm, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                                content = self._decode_text_cached(mm)
+                        else:
+                            content = self._decode_text_cached(f.read())
+                except Exception as e:
+                    logger.error(f"Error reading file: {str(e)}")
+                    return {"error": f"Error reading file: {str(e)}", "filename": filename}
                 
                 if content is None:
                     logger.warning(f"Could not decode file with any standard encoding")
@@ -150,13 +341,146 @@ class FileHandler:
                 "content": content,
                 "extension": file_extension
             }
-            return result
+            self._cache_file(cache_key, result)
+            return dict(result)
             
         except Exception as e:
             filename = getattr(file, "name", str(file)) if hasattr(file, "name") else "unknown file"
             logger.error(f"Unexpected error processing file {filename}: {str(e)}")
             return {"error": f"Unexpected error processing file: {str(e)}", "filename": filename}
     
+    def _cache_file(self, cache_key: tuple, result: Dict[str, Any]):
+        """Store a processed file, evicting the oldest entries beyond the limits.
+        
+        Args:
+            cache_key: (absolute path, mtime_ns, size) of the file
+            result: Dictionary returned by process_file
+        """
+        chars = len(result["content"] or "")
+        if chars > self.FILE_CACHE_MAX_CHARS:
+            return
+        
+        with self._file_cache_lock:
+            previous = self._file_cache.pop(cache_key, None)
+            if previous is not None:
+                self._file_cache_chars -= len(previous["content"] or "")
+            self._file_cache[cache_key] = result
+            self._file_cache_chars += chars
+            while (len(self._file_cache) > self.FILE_CACHE_SIZE
+                   or self._file_cache_chars > self.FILE_CACHE_MAX_CHARS):
+                _, evicted = self._file_cache.popitem(last=False)
+                self._file_cache_chars -= len(evicted["content"] or "")
+    
+    def process_files(self, files: List[Any]) -> List[Dict[str, Any]]:
+        """Process several uploaded files concurrently.
+        
+        Reading and decoding is mostly disk I/O, which releases the GIL, so
+        files are processed on a thread pool. Results keep the input order.
+        
+        Args:
+            files: List of Gradio file objects
+            
+        Returns:
+            List of dictionaries with file metadata and content
+        """
+        if len(files) <= 1:
+            return [self.process_file(file) for file in files]
+        
+        with ThreadPoolExecutor(max_workers=min(self.io_workers, len(files))) as executor:
+            return list(executor.map(self.process_file, files))
+    
+    def process_folder(self, folder_path: str) -> List[Dict[str, Any]]:
+        """Process all supported files in a folder and its subfolders.
+        
+        The tree is walked with os.scandir, whose entries carry the file
+        type and stat results, so no extra stat call is needed per file.
+        Hidden files and folders and files with unsupported extensions are
+        rejected on their name alone, before any stat; oversized files are
+        rejected on the scandir size. Rejected files are only counted.
+        
+        Accepted files are read eagerly through process_files, each one
+        decoded on its own (with its own encoding fallback) on the thread
+        pool, so repeated files are served from the per-file caches.
+        
+        Args:
+            folder_path: Path of the folder to process
+            
+        Returns:
+            List of file dictionaries (with relative_path) plus info entries
+        """
+        if not os.path.isdir(folder_path):
+            logger.warning(f"Folder not found: {folder_path}")
+            return [{"error": f"Folder not found: {folder_path}"}]
+        
+        candidates = []
+        skipped = 0
+        hidden = 0
+        too_large = 0
+        truncated = False
+        debug = logger.isEnabledFor(logging.DEBUG)
+        
+        # Depth-first walk; subfolders are pushed in reverse so they are
+        # visited in alphabetical order
+        stack = [folder_path]
+        while stack and not truncated:
+            current = stack.pop()
+            try:
+                with os.scandir(current) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+            except OSError as e:
+                logger.warning(f"Could not read folder {current}: {str(e)}")
+                continue
+            
+            subfolders = []
+            for entry in entries:
+                name = entry.name
+                if name[0] == ".":
+                    # Dotfiles and folders such as .git or .venv
+                    hidden += 1
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    subfolders.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    extension = _file_extension(name)
+                    if self._allowed_ext_set and extension not in self._allowed_ext_set:
+                        skipped += 1
+                        if debug:
+                            logger.debug(f"Skipping unsupported file: {entry.path}")
+                        continue
+                    st = entry.stat()
+                    if st.st_size > self.max_file_size_bytes:
+                        too_large += 1
+                        if debug:
+                            logger.debug(f"Skipping large file: {entry.path} ({st.st_size/1024/1024:.1f} MB)")
+                        continue
+                    if len(candidates) >= self.max_files:
+                        truncated = True
+                        break
+                    candidates.append({
+                        "path": entry.path,
+                        "name": name,
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "relative_path": os.path.relpath(entry.path, folder_path)
+                    })
+            stack.extend(reversed(subfolders))
+        
+        logger.info(f"Processing folder: {folder_path} ({len(candidates)} files, "
+                    f"{skipped + too_large} skipped, {hidden} hidden)")
+        
+        # Files are independent and mostly wait on disk, so read them on the pool
+        results = self.process_files(candidates)
+        for candidate, info in zip(candidates, results):
+            info["relative_path"] = candidate["relative_path"]
+        
+        if skipped:
+            results.append({"info": f"Skipped {skipped} files with unsupported extensions"})
+        if too_large:
+            results.append({"info": f"Skipped {too_large} files larger than {self.max_file_size_mb} MB"})
+        if truncated:
+            results.append({"info": f"Only the first {self.max_files} files were processed (max_files_per_upload)"})
+        return results
+    
     def format_files_for_llm(self, files: List[Dict[str, Any]]) -> str:
         """Format file information in a way suitable for LLM context.
         
@@ -166,36 +490,29 @@ class FileHandler:
         Returns:
             Formatted string describing files
         """
-        formatted_text = "FILES PROVIDED:\n\n"
+        parts = ["FILES PROVIDED:\n\n"]
         
         for i, file in enumerate(files, 1):
             if "error" in file:
-                formatted_text += f"File {i}: ERROR - {file.get('error')}\n\n"
+                parts.append(f"File {i}: ERROR - {file.get('error')}\n\n")
                 continue
             elif "warning" in file:
-                formatted_text += f"File {i}: WARNING - {file.get('warning')}\n\n"
+                parts.append(f"File {i}: WARNING - {file.get('warning')}\n\n")
                 continue
             elif "info" in file:
-                formatted_text += f"Info: {file.get('info')}\n\n"
+                parts.append(f"Info: {file.get('info')}\n\n")
                 continue
                 
-            formatted_text += f"File {i}: {file.get('filename')}\n"
+            parts.append(f"File {i}: {file.get('filename')}\n")
             
             if "relative_path" in file:
-                formatted_text += f"Path: {file.get('relative_path')}\n"
+                parts.append(f"Path: {file.get('relative_path')}\n")
                 
-            formatted_text += f"Type: {file.get('mime_type')}\n"
-            formatted_text += f"Size: {file.get('size')/1024:.1f} KB\n"
+            parts.append(f"Type: {file.get('mime_type')}\nSize: {file.get('size')/1024:.1f} KB\n")
             
             if file.get("is_text") and file.get("content"):
-                formatted_text += "Content:\n"
-                formatted_text += "```"
-                if file.get("extension"):
-                    formatted_text += file.get("extension").lstrip(".")
-                formatted_text += "\n"
-                formatted_text += file.get("content", "")
-                formatted_text += "\n```\n\n"
+                parts.append(f"Content:\n```{(file.get('extension') or '').lstrip('.')}\n{file['content']}\n```\n\n")
             else:
-                formatted_text += "[Binary file - content not shown]\n\n"
+                parts.append("[Binary file - content not shown]\n\n")
         
-        return formatted_text
\ No newline at end of file
+        return "".join(parts)
\ No newline at end of file
@@ -0,0 +1,78 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+from utils.fast_json import dumps
+
+class ResponseCache:
+    def __init__(self, maxsize: int = 512, ttl: float = 300.0):
+        """Initialize an in-memory LRU cache of provider responses.
+        
+        Identical requests (same endpoint and payload) made within the TTL
+        are answered from memory instead of going back to the API.
+        
+        Args:
+            maxsize: Maximum number of cached responses
+            ttl: Seconds a cached response stays valid
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(endpoint: str, payload: Dict[str, Any]) -> str:
+        """Build a cache key for a request.
+        
+        Args:
+            endpoint: API endpoint the payload is sent to
+            payload: Request payload
+        
+        Returns:
+            Hex digest identifying the request
+        """
+        data = dumps([endpoint, payload], sort_keys=True)
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+    
+    def get(self, key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Return a cached (response text, metadata) tuple, or None on a miss.
+        
+        Args:
+            key: Key from make_key
+        
+        Returns:
+            Tuple of (response text, response metadata), or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, response_text, metadata = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return response_text, dict(metadata)
+    
+    def put(self, key: str, response_text: str, metadata: Dict[str, Any]):
+        """Store a response.
+        
+        Args:
+            key: Key from make_key
+            response_text: Response text
+            metadata: Response metadata
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic(), response_text, dict(metadata))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop all cached responses."""
+        with self._lock:
+            self._entries.clear()
+
+# Shared by the REST providers
+response_cache = ResponseCache()
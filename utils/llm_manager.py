@@ -1,13 +1,25 @@
 import os
-import importlib
-from typing import Dict, List, Any, Optional, Tuple
+import re
+import copy
+import asyncio
+from typing import Dict, List, Any, Optional, Tuple, Iterator
 import yaml
 import dotenv
 from pathlib import Path
+from providers import REGISTRY
+
+# Prefer the libyaml-backed loader when PyYAML was built with it
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
 
 # Load environment variables
 dotenv.load_dotenv()
 
+# Parsed configs keyed by (path, mtime, size), shared by all LLMManager instances
+_CONFIG_CACHE: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+
 class LLMManager:
     def __init__(self, config_path: str = "config/config.yaml"):
         """Initialize the LLM Manager.
@@ -16,8 +28,12 @@ class LLMManager:
             config_path: Path to the YAML configuration file
         """
         self.config = self._load_config(config_path)
-        self.provider_modules = {}
-        self._load_provider_modules()
+        self.provider_modules = {
+            provider_id: REGISTRY[provider_id.lower()]
+            for provider_id in self.config.get("providers", {})
+            if provider_id.lower() in REGISTRY
+        }
+        self._build_indexes()
     
     def _load_config(self, config_path: str) -> Dict[str, Any]:
         """Load configuration from YAML file.
@@ -29,8 +45,15 @@ class LLMManager:
             Dictionary with configuration
         """
         try:
-            with open(config_path, 'r') as file:
-                return yaml.safe_load(file)
+            st = os.stat(config_path)
+            key = (os.path.realpath(config_path), st.st_mtime_ns, st.st_size)
+            config = _CONFIG_CACHE.get(key)
+            if config is None:
+                with open(config_path, 'r') as file:
+                    config = yaml.load(file, Loader=_YamlLoader)
+                _CONFIG_CACHE[key] = config
+            # Each instance gets its own copy so changes don't leak between them
+            return copy.deepcopy(config)
         except Exception as e:
             print(f"Error loading config: {e}")
             return {
@@ -40,15 +63,51 @@ class LLMManager:
                 "ui": {"title": "AI Chatbot", "title_color": "blue"}
             }
     
-    def _load_provider_modules(self):
-        """Load provider modules dynamically."""
-        for provider_id in self.config.get("providers", {}):
-            try:
-                module_name = provider_id.lower()
-                module = importlib.import_module(f"providers.{module_name}")
-                self.provider_modules[provider_id] = module
-            except Exception as e:
-                print(f"Failed to load provider module {provider_id}: {e}")
+    def _build_indexes(self):
+        """Resolve endpoints and index model settings once, after loading the config.
+        
+        ``${VAR}`` placeholders in endpoints are replaced with environment
+        variables (unknown ones are left as they are), each model's
+        settings are indexed by (provider_id, model_id), and each persona's
+        full system prompt (description plus generic settings) is built.
+        """
+        self._resolved_endpoints: Dict[str, str] = {}
+        self._model_index: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._persona_prompts: Dict[str, str] = {}
+        
+        generic_settings = self.config.get("generic_settings", "")
+        for persona in self.config.get("personas", []):
+            description = persona.get("description", "")
+            if generic_settings:
+                description = f"{description}\n\n{generic_settings}"
+            # The first persona with a given id wins, as in a linear search
+            self._persona_prompts.setdefault(persona.get("id"), description)
+        
+        for provider_id, provider_config in self.config.get("providers", {}).items():
+            endpoint = provider_config.get("endpoint", "")
+            self._resolved_endpoints[provider_id] = re.sub(
+                r"\$\{(\w+)\}", lambda m: os.environ.get(m.group(1), m.group(0)), endpoint
+            )
+            for model in provider_config.get("models", []):
+                # The first model with a given id wins, as in a linear search
+                self._model_index.setdefault((provider_id, model.get("id")), model)
+    
+    def _get_provider_module(self, provider_id: str):
+        """Look up the module for a configured provider.
+        
+        Args:
+            provider_id: Provider identifier
+            
+        Returns:
+            The provider module, or None if it is not configured or failed to load
+        """
+        return self.provider_modules.get(provider_id)
+    
+    def close(self):
+        """Release resources (e.g. pooled HTTP connections) held by loaded providers."""
+        for module in self.provider_modules.values():
+            if hasattr(module, "close"):
+                module.close()
     
     def get_providers(self) -> List[Dict[str, str]]:
         """Get list of available providers.
@@ -90,17 +149,42 @@ class LLMManager:
         Returns:
             Persona description with generic settings appended
         """
-        personas = self.config.get("personas", [])
-        generic_settings = self.config.get("generic_settings", "")
+        prompt = self._persona_prompts.get(persona_id)
+        if prompt is None:
+            return self.config.get("generic_settings", "")
+        return prompt
+    
+    def _build_call_kwargs(self,
+                           provider_id: str,
+                           model_id: str,
+                           persona_id: str,
+                           messages: List[Dict[str, str]],
+                           files: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Resolve endpoint, persona and model settings for a provider call.
         
-        for persona in personas:
-            if persona.get("id") == persona_id:
-                description = persona.get("description", "")
-                if generic_settings:
-                    description = f"{description}\n\n{generic_settings}"
-                return description
+        Args:
+            provider_id: Provider identifier
+            model_id: Model identifier
+            persona_id: Persona identifier
+            messages: List of message dictionaries
+            files: Optional list of file dictionaries
+            
+        Returns:
+            Keyword arguments for the provider's chat functions
+        """
+        persona_description = self.get_persona_description(persona_id)
+        
+        endpoint = self._resolved_endpoints.get(provider_id, "")
+        model_config = self._model_index.get((provider_id, model_id), {})
         
-        return generic_settings
+        return {
+            "endpoint": endpoint,
+            "model_id": model_id,
+            "messages": messages,
+            "persona_description": persona_description,
+            "model_config": model_config,
+            "files": files
+        }
     
     def chat_completion(self, 
                        provider_id: str, 
@@ -120,42 +204,113 @@ class LLMManager:
         Returns:
             Tuple of (response text, response metadata)
         """
-        if provider_id not in self.provider_modules:
+        provider_module = self._get_provider_module(provider_id)
+        if provider_module is None:
             return f"Error: Provider {provider_id} not available", {}
         
-        persona_description = self.get_persona_description(persona_id)
-        provider_module = self.provider_modules[provider_id]
-        
-        # Get provider-specific parameters
-        provider_config = self.config.get("providers", {}).get(provider_id, {})
-        endpoint = provider_config.get("endpoint", "")
-        
-        # Replace environment variables in endpoint
-        if "${" in endpoint:
-            for env_var in os.environ:
-                placeholder = f"${{{env_var}}}"
-                if placeholder in endpoint:
-                    endpoint = endpoint.replace(placeholder, os.environ[env_var])
-        
-        # Get model-specific parameters
-        model_config = {}
-        for model in provider_config.get("models", []):
-            if model.get("id") == model_id:
-                model_config = model
-                break
+        kwargs = self._build_call_kwargs(provider_id, model_id, persona_id, messages, files)
         
         try:
             # Call the provider-specific chat function
             if hasattr(provider_module, "chat"):
-                return provider_module.chat(
-                    endpoint=endpoint,
-                    model_id=model_id,
-                    messages=messages,
-                    persona_description=persona_description,
-                    model_config=model_config,
-                    files=files
-                )
+                return provider_module.chat(**kwargs)
+            else:
+                return f"Error: Provider {provider_id} does not implement chat function", {}
+        except Exception as e:
+            return f"Error calling {provider_id} API: {str(e)}", {"error": str(e)}
+    
+    async def chat_completion_async(self,
+                                    provider_id: str,
+                                    model_id: str,
+                                    persona_id: str,
+                                    messages: List[Dict[str, str]],
+                                    files: Optional[List[Dict[str, Any]]] = None) -> Tuple[str, Dict[str, Any]]:
+        """Generate a chat completion without blocking the event loop.
+        
+        Providers that implement ``chat_async`` are awaited directly; for the
+        others the blocking ``chat`` call runs in a worker thread. Several
+        completions can then be overlapped with ``asyncio.gather``.
+        
+        Args:
+            provider_id: Provider identifier
+            model_id: Model identifier
+            persona_id: Persona identifier
+            messages: List of message dictionaries
+            files: Optional list of file dictionaries
+            
+        Returns:
+            Tuple of (response text, response metadata)
+        """
+        provider_module = self._get_provider_module(provider_id)
+        if provider_module is None:
+            return f"Error: Provider {provider_id} not available", {}
+        
+        kwargs = self._build_call_kwargs(provider_id, model_id, persona_id, messages, files)
+        
+        try:
+            if hasattr(provider_module, "chat_async"):
+                return await provider_module.chat_async(**kwargs)
+            elif hasattr(provider_module, "chat"):
+                return await asyncio.to_thread(provider_module.chat, **kwargs)
             else:
                 return f"Error: Provider {provider_id} does not implement chat function", {}
         except Exception as e:
-            return f"Error calling {provider_id} API: {str(e)}", {"error": str(e)}
\ No newline at end of file
+            return f"Error calling {provider_id} API: {str(e)}", {"error": str(e)}
+    
+    async def chat_completion_many(self,
+                                   requests: List[Dict[str, Any]]) -> List[Tuple[str, Dict[str, Any]]]:
+        """Generate several chat completions concurrently.
+        
+        At most ``max_concurrency`` (from the config, default 8) requests are
+        in flight at once.
+        
+        Args:
+            requests: List of dictionaries with provider_id, model_id,
+                persona_id, messages and optional files keys
+            
+        Returns:
+            List of (response text, response metadata) tuples, in input order
+        """
+        semaphore = asyncio.Semaphore(self.config.get("max_concurrency", 8))
+        
+        async def run(request: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+            async with semaphore:
+                return await self.chat_completion_async(
+                    request["provider_id"], request["model_id"], request["persona_id"],
+                    request["messages"], request.get("files")
+                )
+        
+        return list(await asyncio.gather(*(run(request) for request in requests)))
+    
+    def chat_completion_stream(self,
+                               provider_id: str,
+                               model_id: str,
+                               persona_id: str,
+                               messages: List[Dict[str, str]],
+                               files: Optional[List[Dict[str, Any]]] = None) -> Iterator[str]:
+        """Stream a chat completion as text deltas.
+        
+        Providers that implement ``chat_stream`` are streamed token by token;
+        for the others the full ``chat`` response is yielded as one chunk.
+        
+        Args:
+            provider_id: Provider identifier
+            model_id: Model identifier
+            persona_id: Persona identifier
+            messages: List of message dictionaries
+            files: Optional list of file dictionaries
+            
+        Yields:
+            Pieces of the response text
+        """
+        provider_module = self._get_provider_module(provider_id)
+        if provider_module is None or not hasattr(provider_module, "chat_stream"):
+            response_text, _ = self.chat_completion(provider_id, model_id, persona_id, messages, files)
+            yield response_text
+            return
+        
+        kwargs = self._build_call_kwargs(provider_id, model_id, persona_id, messages, files)
+        try:
+            yield from provider_module.chat_stream(**kwargs)
+        except Exception as e:
+            yield f"Error calling {provider_id} API: {str(e)}"
@@ -0,0 +1,141 @@
+import time
+import random
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple, Callable, Awaitable, Any
+
+# Status codes worth retrying: rate limited or a transient server error
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+class TokenBucket:
+    def __init__(self, rpm: float):
+        """Initialize a token bucket allowing `rpm` requests per minute.
+        
+        The bucket starts full, so short bursts of up to `rpm` requests go
+        through immediately; after that requests are spaced out evenly.
+        
+        Args:
+            rpm: Requests per minute
+        """
+        self.rate = rpm / 60.0
+        self.capacity = float(rpm)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _reserve(self) -> float:
+        """Take a token, returning how long the caller must wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+    
+    def acquire(self):
+        """Block until a request may be sent."""
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+    
+    async def acquire_async(self):
+        """Wait, without blocking the event loop, until a request may be sent."""
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+_buckets: Dict[Tuple[str, float], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+def get_bucket(key: str, rpm: Optional[float]) -> Optional[TokenBucket]:
+    """Return the shared token bucket for a key (e.g. an endpoint) and limit.
+    
+    Buckets are keyed by both, so models sharing an endpoint with different
+    limits each keep their own bucket instead of resetting one another's.
+    
+    Args:
+        key: Bucket name
+        rpm: Requests per minute, or None/0 for no limit
+    
+    Returns:
+        TokenBucket, or None when unlimited
+    """
+    if not rpm:
+        return None
+    with _buckets_lock:
+        bucket = _buckets.get((key, rpm))
+        if bucket is None:
+            bucket = TokenBucket(rpm)
+            _buckets[(key, rpm)] = bucket
+        return bucket
+
+def retry_delay(attempt: int, response=None, base: float = 1.0, cap: float = 30.0) -> float:
+    """Compute how long to wait before the next attempt.
+    
+    A numeric Retry-After header on the response is honoured; otherwise
+    exponential backoff with full jitter is used.
+    
+    Args:
+        attempt: Number of attempts made so far (1-based)
+        response: Last HTTP response, if any
+        base: Initial backoff in seconds
+        cap: Maximum backoff in seconds
+    
+    Returns:
+        Delay in seconds
+    """
+    if response is not None:
+        retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(cap, max(0.0, float(retry_after)))
+            except ValueError:
+                pass
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+def send_with_retry(send: Callable[[], Any], key: str, rpm: Optional[float] = None, max_attempts: int = 6):
+    """Send a request through the rate limiter, retrying 429 and 5xx responses.
+    
+    Args:
+        send: Function performing the request and returning the response
+        key: Rate limit bucket name
+        rpm: Requests per minute, or None for no limit
+        max_attempts: Maximum number of attempts
+    
+    Returns:
+        The last response
+    """
+    bucket = get_bucket(key, rpm)
+    for attempt in range(1, max_attempts + 1):
+        if bucket:
+            bucket.acquire()
+        response = send()
+        if response.status_code not in RETRY_STATUS_CODES or attempt == max_attempts:
+            return response
+        # Release the connection of a discarded (possibly streamed) response
+        response.close()
+        time.sleep(retry_delay(attempt, response))
+
+async def send_with_retry_async(send: Callable[[], Awaitable[Any]], key: str, rpm: Optional[float] = None,
+                                max_attempts: int = 6):
+    """Async variant of send_with_retry.
+    
+    Args:
+        send: Coroutine function performing the request and returning the response
+        key: Rate limit bucket name
+        rpm: Requests per minute, or None for no limit
+        max_attempts: Maximum number of attempts
+    
+    Returns:
+        The last response
+    """
+    bucket = get_bucket(key, rpm)
+    for attempt in range(1, max_attempts + 1):
+        if bucket:
+            await bucket.acquire_async()
+        response = await send()
+        if response.status_code not in RETRY_STATUS_CODES or attempt == max_attempts:
+            return response
+        await asyncio.sleep(retry_delay(attempt, response))
@@ -0,0 +1,179 @@
+import os
+import logging
+import threading
+from typing import List, Dict, Any, Optional
+from utils.fast_json import dumps, loads
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    def __init__(self, cache_dir: str, config: Optional[Dict[str, Any]] = None):
+        """Initialize the semantic response cache.
+
+        Prompts are embedded with a sentence-transformers model; a new prompt
+        whose cosine similarity to a cached one reaches the threshold is
+        answered with the cached response. The optional dependencies
+        (sentence-transformers, numpy) are only imported when enabled.
+
+        Args:
+            cache_dir: Directory to persist the cache in
+            config: Configuration dictionary for the semantic cache
+        """
+        self.config = config or {}
+        self.enabled = self.config.get("enabled", False)
+        self.model_name = self.config.get("model", "all-MiniLM-L6-v2")
+        self.threshold = self.config.get("threshold", 0.9)
+        self.cache_dir = cache_dir
+
+        self._lock = threading.Lock()
+        self._model = None
+        self._np = None
+
+        # Embeddings live in a preallocated buffer that doubles when full;
+        # only the first _size rows are valid. Scopes are stored as small
+        # integer ids next to it so matching stays vectorized.
+        self._embeddings = None
+        self._scope_ids = None
+        self._size = 0
+        self._scope_index: Dict[str, int] = {}
+        self._scopes: List[str] = []
+        self._responses: List[str] = []
+
+        # Persisting happens on a background thread; stores made while a
+        # write is running are picked up by one more pass of that thread
+        self._dirty = False
+        self._save_thread: Optional[threading.Thread] = None
+
+        if self.enabled:
+            self._load_backend()
+        if self.enabled:
+            self._load()
+            logger.info(f"Semantic cache enabled with {self._size} entries "
+                        f"(model: {self.model_name}, threshold: {self.threshold})")
+
+    def _load_backend(self):
+        """Import numpy and sentence-transformers, disabling the cache if missing."""
+        try:
+            import numpy as np
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            logger.warning(f"Semantic cache disabled, missing dependency: {e}")
+            self.enabled = False
+            return
+
+        self._np = np
+        self._model = SentenceTransformer(self.model_name)
+
+    def _paths(self):
+        return (os.path.join(self.cache_dir, "embeddings.npy"),
+                os.path.join(self.cache_dir, "entries.json"))
+
+    def _load(self):
+        """Load persisted embeddings and responses, if any."""
+        embeddings_path, entries_path = self._paths()
+        if not (os.path.exists(embeddings_path) and os.path.exists(entries_path)):
+            return
+
+        try:
+            embeddings = self._np.load(embeddings_path)
+            with open(entries_path, "rb") as f:
+                entries = loads(f.read())
+            if len(entries) != len(embeddings):
+                raise ValueError("embeddings and entries are out of sync")
+        except Exception as e:
+            logger.error(f"Error loading semantic cache: {str(e)}")
+            return
+
+        for embedding, entry in zip(embeddings, entries):
+            self._append(embedding, entry["scope"], entry["response"])
+
+    def _append(self, embedding, scope: str, response: str):
+        """Add one entry to the in-memory buffers (caller holds the lock)."""
+        np = self._np
+        if self._embeddings is None:
+            self._embeddings = np.empty((16, embedding.shape[0]), dtype=np.float32)
+            self._scope_ids = np.empty(16, dtype=np.int32)
+        elif self._size == len(self._embeddings):
+            self._embeddings = np.concatenate([self._embeddings, np.empty_like(self._embeddings)])
+            self._scope_ids = np.concatenate([self._scope_ids, np.empty_like(self._scope_ids)])
+
+        scope_id = self._scope_index.setdefault(scope, len(self._scope_index))
+        self._embeddings[self._size] = embedding
+        self._scope_ids[self._size] = scope_id
+        self._scopes.append(scope)
+        self._responses.append(response)
+        self._size += 1
+
+    def _save_loop(self):
+        """Write the cache to disk until no unsaved entries are left."""
+        while True:
+            with self._lock:
+                if not self._dirty:
+                    self._save_thread = None
+                    return
+                self._dirty = False
+                size = self._size
+                embeddings = self._embeddings[:size].copy()
+                entries = [{"scope": scope, "response": response}
+                           for scope, response in zip(self._scopes[:size], self._responses[:size])]
+
+            os.makedirs(self.cache_dir, exist_ok=True)
+            embeddings_path, entries_path = self._paths()
+            try:
+                self._np.save(embeddings_path, embeddings)
+                with open(entries_path, "wb") as f:
+                    f.write(dumps(entries))
+            except Exception as e:
+                logger.error(f"Error saving semantic cache: {str(e)}")
+
+    def _embed(self, text: str):
+        return self._model.encode(text, normalize_embeddings=True).astype(self._np.float32)
+
+    def lookup(self, prompt: str, scope: str) -> Optional[str]:
+        """Return a cached response for a semantically similar prompt.
+
+        Args:
+            prompt: User prompt
+            scope: Key restricting matches, e.g. provider/model/persona
+
+        Returns:
+            Cached response text, or None on a miss
+        """
+        if not self.enabled or not prompt:
+            return None
+
+        embedding = self._embed(prompt)
+        with self._lock:
+            scope_id = self._scope_index.get(scope)
+            if scope_id is None:
+                return None
+
+            sims = self._embeddings[:self._size] @ embedding
+            sims[self._scope_ids[:self._size] != scope_id] = -1.0
+            best = int(sims.argmax())
+            if sims[best] < self.threshold:
+                return None
+
+            logger.debug(f"Semantic cache hit (similarity {sims[best]:.3f})")
+            return self._responses[best]
+
+    def store(self, prompt: str, scope: str, response: str):
+        """Add a prompt/response pair to the cache.
+
+        Args:
+            prompt: User prompt
+            scope: Key restricting matches, e.g. provider/model/persona
+            response: Response text to return for similar prompts
+        """
+        if not self.enabled or not prompt:
+            return
+
+        embedding = self._embed(prompt)
+        with self._lock:
+            self._append(embedding, scope, response)
+            self._dirty = True
+            if self._save_thread is None:
+                self._save_thread = threading.Thread(target=self._save_loop, name="semantic-cache-saver",
+                                                     daemon=True)
+                self._save_thread.start()